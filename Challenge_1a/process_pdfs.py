@@ -8,15 +8,23 @@ Version: 1.0.0
 """
 
 import os
-import json
+import re
 import time
 import logging
+from array import array
+from operator import itemgetter
 from pathlib import Path
 from typing import Dict, List, Any, Tuple, Optional
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 import gc
 
+import numpy as np
+import orjson
+
 # PyMuPDF for high-performance PDF processing
 try:
     import pymupdf as fitz
@@ -27,28 +35,81 @@ except ImportError:
         print("Error: PyMuPDF not installed. Install with: pip install pymupdf")
         exit(1)
 
+# Errors surface as exceptions and are logged per page; keep MuPDF's own stderr chatter quiet
+fitz.TOOLS.mupdf_display_errors(False)
+fitz.TOOLS.mupdf_display_warnings(False)
+
+# Text-only extraction: no image payloads, ligatures expanded to plain characters.
+# Image blocks are only requested for pages that actually reference images.
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES & ~fitz.TEXT_PRESERVE_LIGATURES
+TEXT_AND_IMAGE_FLAGS = TEXT_FLAGS | fitz.TEXT_PRESERVE_IMAGES
+
+# Inline image operator (BI ... ID ... EI) in a page content stream
+INLINE_IMAGE_OPERATOR = re.compile(rb"(?:^|\s)BI[\s/]")
+
+
+def page_has_images(page: fitz.Page) -> bool:
+    """Whether a page may draw an image: image XObjects, Form XObjects or inline images"""
+    # get_images() only lists xref images; Form XObjects may hold inline images of their own
+    if page.get_images() or page.get_xobjects():
+        return True
+    return INLINE_IMAGE_OPERATOR.search(page.read_contents()) is not None
+
+# (is_bold, is_italic) for the low five span flag bits: bold = 16, italic = 2
+FLAG_TABLE = [(bool(i & 16), bool(i & 2)) for i in range(32)]
+
+_span_size = itemgetter("size")
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Smallest page range worth shipping to a worker (each worker reopens the PDF)
+MIN_PAGES_PER_WORKER = 4
+
+# Larger PDFs are reopened from disk by each worker: every worker makes a private copy of a
+# shared-memory segment, so peak memory there is roughly (workers + 2) x file size
+SHARED_MEMORY_MAX_BYTES = 32 * 1024 * 1024
+
+# Sections are accumulated column-wise (one list per field) and only turned into
+# per-section dicts when the result is assembled for JSON output
+SECTION_COLUMNS = ("types", "contents", "pages", "bboxes", "font_names", "font_sizes", "font_flags", "levels")
+
+
+def new_section_columns() -> Dict[str, List[Any]]:
+    """Create an empty set of section columns"""
+    return {name: [] for name in SECTION_COLUMNS}
+
+
+# Font names repeat on every span; keep one str object per distinct name
+_string_pool: Dict[str, str] = {}
+
+
+def intern_string(value: str) -> str:
+    """Return the pooled copy of a repeated string"""
+    return _string_pool.setdefault(value, value)
+
 
 class PDFProcessor:
     """High-performance PDF processor for Adobe Hackathon Challenge 1a"""
 
-    def __init__(self):
+    def __init__(self, executor: Optional[ProcessPoolExecutor] = None, workers: int = 1):
         self.library_version = fitz.version[1] if hasattr(fitz, 'version') else "Unknown"
+        self.executor = executor
+        self.workers = workers
 
     def analyze_font_statistics(self, doc: fitz.Document, sample_pages: int = 5) -> Dict[str, float]:
         """Analyze font statistics to determine heading vs paragraph thresholds"""
-        font_sizes = []
-        bold_sizes = []
+        # Typed buffers avoid boxing every span size into a list of Python floats
+        font_sizes = array("d")
+        bold_sizes = array("d")
 
         # Sample first few pages to understand document typography
         sample_pages = min(sample_pages, doc.page_count)
 
         for page_num in range(sample_pages):
             page = doc[page_num]
-            blocks = page.get_text("dict")["blocks"]
+            blocks = page.get_text("dict", flags=TEXT_FLAGS)["blocks"]
 
             for block in blocks:
                 if block["type"] == 0:  # Text block
@@ -59,62 +120,128 @@ class PDFProcessor:
 
                             font_sizes.append(size)
 
-                            # Check if bold (flags & 16)
-                            if flags & 16:
+                            # Check if bold
+                            if FLAG_TABLE[flags & 0x1F][0]:
                                 bold_sizes.append(size)
 
         if not font_sizes:
             return {"avg_size": 12, "heading_threshold": 14, "large_heading_threshold": 16}
 
-        avg_size = sum(font_sizes) / len(font_sizes)
-        max_size = max(font_sizes)
+        sizes = np.frombuffer(font_sizes, dtype=np.float64)
+        avg_size = float(sizes.mean())
+        max_size = float(sizes.max())
+        p90_size = float(np.percentile(sizes, 90))
 
         # Calculate thresholds
         heading_threshold = avg_size * 1.2  # 20% larger than average
-        large_heading_threshold = avg_size * 1.5  # 50% larger than average
+        # 50% larger than average, raised to the 90th percentile when large text is common
+        large_heading_threshold = max(avg_size * 1.5, p90_size)
 
         return {
             "avg_size": avg_size,
             "max_size": max_size,
             "heading_threshold": heading_threshold,
             "large_heading_threshold": large_heading_threshold,
-            "bold_sizes": bold_sizes
+            "bold_sizes": np.frombuffer(bold_sizes, dtype=np.float64)
         }
 
-    def classify_text_type(self, span: Dict, font_stats: Dict) -> Tuple[str, int]:
-        """Classify text as heading, paragraph, footnote based on font properties"""
-        size = span["size"]
-        flags = span["flags"]
-        text = span["text"].strip()
-
-        # Check for bold (flags & 16)
-        is_bold = bool(flags & 16)
-        # Check for italic (flags & 2)
-        is_italic = bool(flags & 2)
-
-        # Determine text type and heading level
-        if size >= font_stats["large_heading_threshold"]:
-            return "heading", 1  # Main heading
-        elif size >= font_stats["heading_threshold"] or (size > font_stats["avg_size"] and is_bold):
-            return "heading", 2  # Subheading
-        elif size < font_stats["avg_size"] * 0.8:
-            return "footnote", 0  # Footnote
-        else:
-            return "paragraph", 0  # Regular paragraph
+    @staticmethod
+    def classification_thresholds(font_stats: Dict) -> Tuple[float, float, float, float]:
+        """Flatten font statistics into (avg, heading, large heading, footnote) size thresholds"""
+        avg_size = font_stats["avg_size"]
+        return (
+            avg_size,
+            font_stats["heading_threshold"],
+            font_stats["large_heading_threshold"],
+            avg_size * 0.8
+        )
+
+    def disable_pool(self, error: Exception):
+        """Stop submitting to a broken worker pool; later work runs in this process"""
+        if self.executor is not None:
+            logger.error(f"Worker pool failed, continuing sequentially: {error}")
+            self.executor = None
+
+    def split_pages(self, page_count: int) -> List[Tuple[int, int]]:
+        """Split a document's pages into contiguous [start, end) ranges, one per worker"""
+        chunks = max(1, min(self.workers, page_count // MIN_PAGES_PER_WORKER))
+        step, extra = divmod(page_count, chunks)
+        ranges, start = [], 0
+        for i in range(chunks):
+            end = start + step + (1 if i < extra else 0)
+            ranges.append((start, end))
+            start = end
+        return ranges
+
+    def extract_page_range(self, doc: fitz.Document, start: int, end: int,
+                           thresholds: Tuple[float, float, float, float], name: str) -> Dict[str, List[Any]]:
+        """Extract section columns from pages [start, end) of an open document"""
+        columns = new_section_columns()
+
+        for page_num in range(start, end):
+            page = doc[page_num]
+
+            try:
+                # Get structured text data, decoding images only where the page has any
+                flags = TEXT_AND_IMAGE_FLAGS if page_has_images(page) else TEXT_FLAGS
+                blocks = page.get_text("dict", flags=flags)["blocks"]
+
+                for block in blocks:
+                    if block["type"] == 0:  # Text block
+                        self._process_text_block(block, page_num + 1, thresholds, columns)
+                    elif block["type"] == 1:  # Image block
+                        self._process_image_block(block, page_num + 1, columns)
+
+            except Exception as e:
+                logger.error(f"Error processing page {page_num + 1} of {name}: {e}")
+                continue
+
+        return columns
+
+    @staticmethod
+    def materialize_sections(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+        """Turn section columns into the list of section dicts emitted in the JSON output"""
+        sections = []
+        for text_type, content, page, bbox, font_name, font_size, font_flags, level in zip(
+                *(columns[name] for name in SECTION_COLUMNS)):
+            section = {
+                "type": text_type,
+                "content": content,
+                "page": page,
+                "bbox": bbox,
+                "font": {
+                    "name": font_name,
+                    "size": font_size,
+                    "flags": font_flags,
+                    "color": 0  # Default color
+                }
+            }
+            # Add level for headings
+            if level > 0:
+                section["level"] = level
+            sections.append(section)
+        return sections
 
     def extract_pdf_structure(self, pdf_path: Path) -> Dict[str, Any]:
         """Extract structured data from a PDF file"""
         start_time = time.time()
 
         try:
-            # Open PDF document
-            doc = fitz.open(str(pdf_path))
+            # Small files are read once and handed to workers through shared memory;
+            # large ones are opened from disk so the OS page cache is shared instead
+            if pdf_path.stat().st_size <= SHARED_MEMORY_MAX_BYTES:
+                pdf_bytes = pdf_path.read_bytes()
+                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            else:
+                pdf_bytes = None
+                doc = fitz.open(str(pdf_path))
 
             # Get document metadata
             metadata = doc.metadata
 
-            # Analyze font statistics
+            # Analyze font statistics once per document
             font_stats = self.analyze_font_statistics(doc)
+            thresholds = self.classification_thresholds(font_stats)
 
             # Initialize result structure
             result = {
@@ -155,27 +282,44 @@ class PDFProcessor:
             except Exception as e:
                 logger.warning(f"Could not extract outline from {pdf_path.name}: {e}")
 
-            # Process each page
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
+            # Process pages, split into ranges across the worker pool
+            columns = new_section_columns()
+            ranges = self.split_pages(doc.page_count)
 
+            if self.executor is None or len(ranges) == 1:
+                columns = self.extract_page_range(doc, 0, doc.page_count, thresholds, pdf_path.name)
+            else:
+                shm = None
                 try:
-                    # Get structured text data
-                    blocks = page.get_text("dict")["blocks"]
+                    if pdf_bytes is not None:
+                        shm = SharedMemory(create=True, size=len(pdf_bytes))
+                        shm.buf[:len(pdf_bytes)] = pdf_bytes
+
+                    futures = [
+                        self.executor.submit(_extract_page_range, str(pdf_path), shm and shm.name,
+                                             len(pdf_bytes or b""), start, end, thresholds)
+                        for start, end in ranges
+                    ]
+                    # Merge partial results in page order
+                    for future in futures:
+                        partial = future.result()
+                        # Re-pool font names, each worker unpickles its own copies
+                        partial["font_names"] = [intern_string(n) for n in partial["font_names"]]
+                        for name in SECTION_COLUMNS:
+                            columns[name].extend(partial[name])
 
-                    for block in blocks:
-                        if block["type"] == 0:  # Text block
-                            self._process_text_block(block, page_num + 1, font_stats, result)
-                        elif block["type"] == 1:  # Image block
-                            self._process_image_block(block, page_num + 1, result)
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        self.disable_pool(e)
+                    logger.error(f"Page-parallel extraction failed for {pdf_path.name}, falling back to sequential: {e}")
+                    columns = self.extract_page_range(doc, 0, doc.page_count, thresholds, pdf_path.name)
 
-                    # Force garbage collection every 10 pages
-                    if page_num % 10 == 0:
-                        gc.collect()
+                finally:
+                    if shm is not None:
+                        shm.close()
+                        shm.unlink()
 
-                except Exception as e:
-                    logger.error(f"Error processing page {page_num + 1} of {pdf_path.name}: {e}")
-                    continue
+            result["structure"]["sections"] = self.materialize_sections(columns)
 
             doc.close()
 
@@ -203,91 +347,112 @@ class PDFProcessor:
                 }
             }
 
-    def _process_text_block(self, block: Dict, page_num: int, font_stats: Dict, result: Dict):
-        """Process a text block and add to results"""
+    def _process_text_block(self, block: Dict, page_num: int, thresholds: Tuple[float, float, float, float],
+                            columns: Dict[str, List[Any]]):
+        """Process a text block and append it to the section columns"""
         block_text_parts = []
-        primary_font = None
-        primary_size = 0
-        primary_flags = 0
+        text_spans = []
 
-        # Collect text and find primary font characteristics
+        # Collect text and the spans that carry it
         for line in block["lines"]:
             for span in line["spans"]:
                 text = span["text"].strip()
                 if text:
                     block_text_parts.append(text)
-
-                    # Track primary font (largest or most common)
-                    if span["size"] > primary_size:
-                        primary_size = span["size"]
-                        primary_font = span["font"]
-                        primary_flags = span["flags"]
+                    text_spans.append(span)
 
         if not block_text_parts:
             return
 
-        # Combine text and classify
-        block_text = " ".join(block_text_parts).strip()
-        if not block_text:
-            return
+        # Primary font is the first largest span; max() does the scan in C
+        primary = text_spans[0] if len(text_spans) == 1 else max(text_spans, key=_span_size)
+        if primary["size"] > 0:
+            primary_size = primary["size"]
+            primary_font = intern_string(primary["font"])
+            primary_flags = primary["flags"]
+        else:
+            primary_font, primary_size, primary_flags = None, 0, 0
 
-        # Create primary span for classification
-        primary_span = {
-            "text": block_text,
-            "size": primary_size,
-            "flags": primary_flags,
-            "font": primary_font
-        }
+        # Combine text and classify (parts are already stripped and non-empty,
+        # and most blocks hold a single span, so skip the join for those)
+        if len(block_text_parts) == 1:
+            block_text = block_text_parts[0]
+        else:
+            block_text = " ".join(block_text_parts)
+
+        # Classify text as heading, paragraph, footnote based on the primary font
+        avg_size, heading_threshold, large_heading_threshold, footnote_threshold = thresholds
+        is_bold, _ = FLAG_TABLE[primary_flags & 0x1F]
+
+        if primary_size >= large_heading_threshold:
+            text_type, level = "heading", 1  # Main heading
+        elif primary_size >= heading_threshold or (primary_size > avg_size and is_bold):
+            text_type, level = "heading", 2  # Subheading
+        elif primary_size < footnote_threshold:
+            text_type, level = "footnote", 0  # Footnote
+        else:
+            text_type, level = "paragraph", 0  # Regular paragraph
+
+        # Append section entry (level is only kept for headings)
+        columns["types"].append(text_type)
+        columns["contents"].append(block_text)
+        columns["pages"].append(page_num)
+        columns["bboxes"].append(block["bbox"])
+        columns["font_names"].append(primary_font or "unknown")
+        columns["font_sizes"].append(primary_size)
+        columns["font_flags"].append(primary_flags)
+        columns["levels"].append(level if text_type == "heading" else 0)
+
+    def _process_image_block(self, block: Dict, page_num: int, columns: Dict[str, List[Any]]):
+        """Process an image block and append it to the section columns"""
+        columns["types"].append("image")
+        columns["contents"].append(f"[Image: width={block.get('width', 0)}, height={block.get('height', 0)}]")
+        columns["pages"].append(page_num)
+        columns["bboxes"].append(block["bbox"])
+        columns["font_names"].append("image")
+        columns["font_sizes"].append(0)
+        columns["font_flags"].append(0)
+        columns["levels"].append(0)
+
+
+def _extract_page_range(pdf_path: str, shm_name: Optional[str], size: int, start: int, end: int,
+                        thresholds: Tuple[float, float, float, float]) -> Dict[str, List[Any]]:
+    """Worker entry point: open the PDF (from shared memory if given) and extract section columns for pages [start, end)"""
+    if shm_name is None:
+        doc = fitz.open(pdf_path)
+    else:
+        shm = SharedMemory(name=shm_name)
+        try:
+            # fitz needs an owned bytes object; this is a memcpy, not a filesystem read
+            doc = fitz.open(stream=bytes(shm.buf[:size]), filetype="pdf")
+        finally:
+            shm.close()
+    try:
+        return PDFProcessor().extract_page_range(doc, start, end, thresholds, Path(pdf_path).name)
+    finally:
+        doc.close()
 
-        text_type, level = self.classify_text_type(primary_span, font_stats)
-
-        # Create section entry
-        section = {
-            "type": text_type,
-            "content": block_text,
-            "page": page_num,
-            "bbox": block["bbox"],
-            "font": {
-                "name": primary_font or "unknown",
-                "size": primary_size,
-                "flags": primary_flags,
-                "color": 0  # Default color
-            }
-        }
 
-        # Add level for headings
-        if text_type == "heading" and level > 0:
-            section["level"] = level
-
-        result["structure"]["sections"].append(section)
-
-    def _process_image_block(self, block: Dict, page_num: int, result: Dict):
-        """Process an image block and add to results"""
-        result["structure"]["sections"].append({
-            "type": "image",
-            "content": f"[Image: width={block.get('width', 0)}, height={block.get('height', 0)}]",
-            "page": page_num,
-            "bbox": block["bbox"],
-            "font": {
-                "name": "image",
-                "size": 0,
-                "flags": 0,
-                "color": 0
-            }
-        })
+def count_pages(pdf_path: Path) -> int:
+    """Page count from the xref only, used to choose file- or page-level parallelism"""
+    try:
+        with fitz.open(str(pdf_path)) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
 
 
-def process_single_pdf(pdf_path: Path, output_dir: Path) -> bool:
-    """Process a single PDF file"""
+def process_single_pdf(pdf_path: Path, output_dir: Path, processor: Optional[PDFProcessor] = None) -> bool:
+    """Process a single PDF file, splitting its pages across the processor's worker pool if it has one"""
     try:
-        processor = PDFProcessor()
+        processor = processor or PDFProcessor()
         result = processor.extract_pdf_structure(pdf_path)
 
         # Generate output JSON file
         output_file = output_dir / f"{pdf_path.stem}.json"
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        # orjson encodes straight to UTF-8 bytes in C
+        output_file.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2))
 
         logger.info(f"✅ Generated {output_file.name}")
         return True
@@ -296,6 +461,10 @@ def process_single_pdf(pdf_path: Path, output_dir: Path) -> bool:
         logger.error(f"❌ Failed to process {pdf_path.name}: {e}")
         return False
 
+    finally:
+        # One full collection between PDFs; per-page dicts are freed by refcounting
+        gc.collect()
+
 
 def process_pdfs():
     """Main function to process all PDFs in input directory"""
@@ -315,35 +484,65 @@ def process_pdfs():
 
     logger.info(f"Found {len(pdf_files)} PDF files to process")
 
-    # Process files with multiprocessing for better performance
     success_count = 0
 
-    # Determine optimal number of workers (max 4 to avoid memory issues)
-    max_workers = min(4, os.cpu_count() or 1)
+    # Each worker holds one small PDF or one page range of a large one, so use every core
+    max_workers = os.cpu_count() or 1
 
-    if len(pdf_files) == 1:
-        # Single file - process directly
-        if process_single_pdf(pdf_files[0], output_dir):
-            success_count = 1
-    else:
-        # Multiple files - use multiprocessing
-        try:
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                futures = [
-                    executor.submit(process_single_pdf, pdf_file, output_dir) 
-                    for pdf_file in pdf_files
-                ]
+    # Start the shared-memory resource tracker before workers exist so they inherit it
+    # instead of each starting their own (which would unlink segments on worker exit).
+    # Windows has no resource tracker: segments live until their last handle closes.
+    if os.name == "posix":
+        resource_tracker.ensure_running()
 
-                for future in futures:
-                    if future.result():
-                        success_count += 1
+    try:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    except Exception as e:
+        logger.error(f"Multiprocessing failed, falling back to sequential: {e}")
+        executor = None
 
-        except Exception as e:
-            logger.error(f"Multiprocessing failed, falling back to sequential: {e}")
-            # Fallback to sequential processing
-            for pdf_file in pdf_files:
-                if process_single_pdf(pdf_file, output_dir):
-                    success_count += 1
+    processor = PDFProcessor(executor, max_workers)
+
+    try:
+        # PDFs too short to split run whole as pool tasks, so their per-file work (font stats,
+        # outline, JSON encoding) overlaps across files; larger PDFs are page-split from here
+        small_files, large_files = [], []
+        for pdf_file in pdf_files:
+            if len(processor.split_pages(count_pages(pdf_file))) == 1:
+                small_files.append(pdf_file)
+            else:
+                large_files.append(pdf_file)
+
+        small_futures = []
+        for pdf_file in small_files:
+            future = None
+            if processor.executor is not None:
+                try:
+                    future = processor.executor.submit(process_single_pdf, pdf_file, output_dir)
+                except Exception as e:
+                    processor.disable_pool(e)
+            small_futures.append((pdf_file, future))
+
+        for pdf_file in large_files:
+            if process_single_pdf(pdf_file, output_dir, processor):
+                success_count += 1
+
+        for pdf_file, future in small_futures:
+            succeeded = None
+            if future is not None:
+                try:
+                    succeeded = future.result()
+                except Exception as e:
+                    processor.disable_pool(e)
+            if succeeded is None:
+                # Pool unavailable or broke before this file finished
+                succeeded = process_single_pdf(pdf_file, output_dir)
+            if succeeded:
+                success_count += 1
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     logger.info(f"Processing complete: {success_count}/{len(pdf_files)} files successful")
 
@@ -1,11 +1,151 @@
-from sentence_transformers import SentenceTransformer
-import numpy as np, itertools
+from pathlib import Path
+from transformers import AutoTokenizer
+import onnxruntime as ort
+import numpy as np, itertools, os, hashlib, diskcache
+
+_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"   # 384-d, 22 MB [3]
+_ONNX_DIR = Path(os.environ.get("EMBED_ONNX_DIR", Path.home() / ".cache" / "minilm-int8"))
+_DIM = 384
+_MAX_SEQ_LENGTH = 256                                  # same cap as sentence-transformers config
+_cache = diskcache.Cache(os.environ.get("EMBED_CACHE_DIR", "/tmp/embed_cache"))
+
+def _export_int8(out_dir: Path) -> None:
+    # build-time only (`python embed.py`, see Dockerfile): export to ONNX + dynamic int8
+    # quantization (VNNI kernels on AVX-512 CPUs); needs network + torch
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    fp32 = ORTModelForFeatureExtraction.from_pretrained(_MODEL_ID, export=True)
+    ORTQuantizer.from_pretrained(fp32).quantize(
+        save_dir=out_dir,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False))
+    AutoTokenizer.from_pretrained(_MODEL_ID).save_pretrained(out_dir)
+
+class _OnnxEncoder:
+    """Drop-in for SentenceTransformer.encode: mean pooling + L2 norm over an int8 ORT session."""
+    def __init__(self, model_dir: Path):
+        if not (model_dir / "model_quantized.onnx").exists():
+            raise FileNotFoundError(f"no int8 MiniLM export in {model_dir}; build it with "
+                                    f"`EMBED_ONNX_DIR={model_dir} python embed.py` or set EMBED_ONNX_DIR")
+        # weights are held as bytes (shared copy-on-write by forked workers); the ORT session
+        # owns a thread pool that does not survive fork, so each process builds its own lazily
+        self._onnx = (model_dir / "model_quantized.onnx").read_bytes()
+        self.tag = hashlib.sha1(self._onnx).hexdigest()[:16]   # artifact identity for cache keys
+        self._session, self._session_pid = None, None
+        self.threads = 0                               # ORT intra-op threads, 0 = all cores
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = _MAX_SEQ_LENGTH
+
+    @property
+    def session(self) -> ort.InferenceSession:
+        if self._session_pid != os.getpid():
+            opts = ort.SessionOptions()
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            opts.intra_op_num_threads = self.threads
+            self._session = ort.InferenceSession(self._onnx, opts, providers=["CPUExecutionProvider"])
+            self._session_pid = os.getpid()
+        return self._session
+
+    def encode(self, texts: list[str], batch_size: int = 64, max_length: int | None = None, **_) -> np.ndarray:
+        max_length = max_length or self.max_seq_length
+        out = np.empty((len(texts), _DIM), dtype=np.float32)
+        order = np.argsort([-len(t) for t in texts], kind="stable")  # length-sorted batches pad less
+        session = self.session
+        inputs = [i.name for i in session.get_inputs()]
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start+batch_size]
+            enc = self.tokenizer([texts[i] for i in idx], padding=True, truncation=True,
+                                 max_length=max_length, return_tensors="np")
+            hidden = session.run(None, {k: enc[k].astype(np.int64) for k in inputs})[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            emb = (hidden * mask).sum(1) / np.clip(mask.sum(1), 1e-9, None)
+            out[idx] = emb / np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+_model = None
+
+def load_model() -> _OnnxEncoder:
+    return _OnnxEncoder(_ONNX_DIR)
+
+def init_worker(model: _OnnxEncoder, threads: int = 0) -> None:
+    # ProcessPoolExecutor initializer: reuse the parent's encoder instead of reloading it,
+    # limited to this worker's share of the cores (0 = all)
+    global _model
+    _model = model
+    _model.threads = threads
+
+def _get_model() -> _OnnxEncoder:
+    global _model
+    if _model is None:
+        _model = load_model()
+    return _model
+
+def _hashes(texts: list[str]) -> list[str]:
+    return [hashlib.sha1(t.encode("utf-8")).hexdigest() for t in texts]
+
+def _token_lengths(model: _OnnxEncoder, texts: list[str], hashes: list[str]) -> list[int]:
+    # token counts are cached too, so a fully cached re-run never touches the tokenizer
+    keys = [f"{model.tag}:len:{h}" for h in hashes]
+    lens, misses = [0] * len(texts), []
+    with _cache.transact():
+        for i, key in enumerate(keys):
+            n = _cache.get(key)
+            if n is None:
+                misses.append(i)
+            else:
+                lens[i] = n
+    if misses:
+        ids = model.tokenizer([texts[i] for i in misses])["input_ids"]
+        with _cache.transact():
+            for i, tok in zip(misses, ids):
+                lens[i] = len(tok)
+                _cache.set(keys[i], lens[i])
+    return lens
+
+def _seq_cap(lengths: list[int]) -> int:
+    # p95 token length of the corpus cuts padding waste; never above the model's limit
+    if not lengths:
+        return _MAX_SEQ_LENGTH
+    return int(min(_MAX_SEQ_LENGTH, np.percentile(lengths, 95)))
+
+def _cached_encode(model: _OnnxEncoder, texts: list[str], hashes: list[str], lens: list[int],
+                   batch_size: int, max_length: int) -> np.ndarray:
+    # a vector depends on the artifact and the text's effective (truncated) length, so a
+    # shifting corpus cap only invalidates the texts it actually cuts
+    keys = [f"{model.tag}:{min(n, max_length)}:{h}" for n, h in zip(lens, hashes)]
+    out, misses = np.empty((len(texts), _DIM), dtype=np.float32), []
+    with _cache.transact():
+        for i, key in enumerate(keys):
+            blob = _cache.get(key)
+            if blob is None:
+                misses.append(i)
+            else:
+                out[i] = np.frombuffer(blob, dtype=np.float32)
+    if misses:
+        vecs = model.encode([texts[i] for i in misses], batch_size=batch_size, max_length=max_length,
+                            show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=True)
+        out[misses] = vecs
+        with _cache.transact():
+            for i, vec in zip(misses, vecs):
+                _cache.set(keys[i], vec.tobytes())   # 1536 B per 384-d float32 vector
+    return out
 
-_model = SentenceTransformer("all-MiniLM-L6-v2")  # 384-d, 22 MB [3]
 def embed_texts(texts: list[str]) -> np.ndarray:
-    return _model.encode(texts, batch_size=64, show_progress_bar=False,
-                         convert_to_numpy=True, normalize_embeddings=True)
+    model, hashes = _get_model(), _hashes(texts)
+    lens = _token_lengths(model, texts, hashes)
+    return _cached_encode(model, texts, hashes, lens, batch_size=64, max_length=_MAX_SEQ_LENGTH)
 
-     
+def embed_with_query(texts: list[str], query: str) -> np.ndarray:
+    # query vector is the last row; the corpus is capped at its p95 length, but the
+    # query drives the ranking so it is never cut below its own token length
+    model, all_texts = _get_model(), texts + [query]
+    hashes = _hashes(all_texts)
+    lens = _token_lengths(model, all_texts, hashes)
+    cap = _seq_cap(lens[:-1])
+    q_cap = min(_MAX_SEQ_LENGTH, max(cap, lens[-1]))
+    if q_cap == cap:                           # common case: one encode call for both
+        return _cached_encode(model, all_texts, hashes, lens, batch_size=128, max_length=cap)
+    return np.vstack([_cached_encode(model, texts, hashes[:-1], lens[:-1], batch_size=128, max_length=cap),
+                      _cached_encode(model, [query], hashes[-1:], lens[-1:], batch_size=128, max_length=q_cap)])
 
-     
\ No newline at end of file
+if __name__ == "__main__":
+    _export_int8(_ONNX_DIR)
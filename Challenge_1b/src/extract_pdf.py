@@ -2,21 +2,23 @@ import fitz  # PyMuPDF
 from pathlib import Path
 from typing import List, Dict
 
+# text only: no image blocks, ligatures expanded, whitespace folded by MuPDF
+_TEXT_FLAGS = (fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
+               & ~fitz.TEXT_PRESERVE_LIGATURES & ~fitz.TEXT_PRESERVE_WHITESPACE)
+
 def extract_blocks(pdf_path: Path) -> List[Dict]:
     doc = fitz.open(pdf_path)
     blocks = []
     for page_no, page in enumerate(doc, 1):
-        for blk in page.get_text("dict")["blocks"]:
-            if blk["type"] != 0:          # skip images
+        # plain (x0, y0, x1, y1, text, block_no, block_type) tuples, no span dicts
+        for x0, y0, x1, y1, raw, bno, btype in page.get_text("blocks", flags=_TEXT_FLAGS):
+            if btype != 0:                # skip images
+                continue
+            text = " ".join(raw.split())  # fold line breaks inside the block
+            if not text:                  # ignore blank
                 continue
-            for line in blk["lines"]:
-                text = " ".join([span["text"] for span in line["spans"]]).strip()
-                if not text:               # ignore blank
-                    continue
-                font_size = line["spans"][0]["size"]
-                blocks.append({
-                    "page": page_no,
-                    "font": font_size,
-                    "text": text
-                })
-    return blocks
\ No newline at end of file
+            blocks.append({
+                "page": page_no,
+                "text": text
+            })
+    return blocks
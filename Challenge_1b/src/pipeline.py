@@ -1,11 +1,13 @@
 from pathlib import Path, PurePath
 from datetime import datetime as dt
-from pydantic import BaseModel, Field, ValidationError
+from pydantic import BaseModel, Field
 from extract_pdf import extract_blocks
-from embed import embed_texts
-from rank import build_faiss, topk
-from refine import refine
-import json, tqdm, numpy as np, os, sys
+from concurrent.futures import ProcessPoolExecutor
+import json, orjson, tqdm, numpy as np, os, sys, multiprocessing as mp
+
+def _mp_context():
+    # fork shares loaded state copy-on-write; it is unavailable on Windows and unsafe on macOS
+    return mp.get_context("fork" if sys.platform.startswith("linux") else "spawn")
 
 class Meta(BaseModel):
     input_documents: list[str]
@@ -24,56 +26,83 @@ class SubSection(BaseModel):
     refined_text: str
     page_number: int
 
-def run(input_json: Path, pdf_dir: Path, out_file: Path):
+def run(input_json: Path, pdf_dir: Path, out_file: Path, workers: int | None = None):
+    # heavy ML imports (onnxruntime, faiss, sumy/NLTK) are deferred so importing this module stays cheap
+    from embed import embed_with_query
+    from rank import build_faiss, topk, set_threads
+    from refine import refine
+    if workers:
+        set_threads(workers)
     with input_json.open() as f:
         conf = json.load(f)
     persona = conf["persona"]["role"]
     task    = conf["job_to_be_done"]["task"]
     # ---------- ingest ----------
-    docs, texts, pages = [], [], []
-    for item in conf["documents"]:
-        pdf_path = pdf_dir / item["filename"]
-        blocks   = extract_blocks(pdf_path)
+    pdf_paths = [pdf_dir / item["filename"] for item in conf["documents"]]
+    # fork starts every worker up front, each inheriting the loaded encoder: no more than one per PDF
+    n_workers = min(len(pdf_paths), workers or os.cpu_count() or 1) or 1
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=_mp_context()) as ex:
+        results = list(ex.map(extract_blocks, pdf_paths))   # one PDF per worker, input order kept
+    doc_names = [p.name for p in pdf_paths]   # doc_ids index into this table
+    doc_ids, texts, pages = [], [], []
+    for doc_id, blocks in enumerate(results):
         for blk in blocks:
-            docs.append(pdf_path.name)
+            doc_ids.append(doc_id)
             pages.append(blk["page"])
             texts.append(blk["text"])
     # ---------- embed ----------
-    vecs = embed_texts(texts)
+    all_vecs = embed_with_query(texts, persona+" "+task)
+    vecs, q_vec = all_vecs[:-1], all_vecs[-1]
     index = build_faiss(vecs)
-    q_vec = embed_texts([persona+" "+task])[0]
     scores, ids = topk(index, q_vec, k=40)
     # ---------- post-rank ----------
     candidates = []
-    for rank, idx in enumerate(ids[0], 1):
-        cand = {
-            "document": docs[idx],
+    for rank, idx in enumerate(ids[0][:15], 1):
+        candidates.append({
+            "document": doc_names[doc_ids[idx]],
             "section_title": texts[idx][:120],
             "importance_rank": rank,
             "page_number": int(pages[idx]),
-            "refined_text": refine(texts[idx])
-        }
-        candidates.append(cand)
+        })
+    # only the emitted sections are summarised
+    for cand, idx in zip(candidates, ids[0]):
+        cand["refined_text"] = refine(texts[idx])
     # ---------- pack ----------
     output = {
         "metadata": Meta(
             input_documents=[d["filename"] for d in conf["documents"]],
             persona=persona,
-            job_to_be_done=task).model_dump(),
-        "extracted_sections": [Section(**c).model_dump() for c in candidates[:15]],
-        "subsection_analysis": [SubSection(**c).model_dump() for c in candidates[:15]]
+            job_to_be_done=task).model_dump(mode="json"),
+        "extracted_sections": [Section(**c).model_dump(mode="json") for c in candidates],
+        "subsection_analysis": [SubSection(**c).model_dump(mode="json") for c in candidates]
     }
-    # validate & write
-    try:
-        json.dumps(output)  # quick validation
-    except (TypeError, ValidationError) as e:
-        sys.exit(f"JSON validation failed: {e}")
-    out_file.write_text(json.dumps(output, ensure_ascii=False, indent=2))
+    # single serialisation pass; orjson raises on anything non-serialisable
+    out_file.write_bytes(orjson.dumps(output, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
-if _name_ == "_main_":
+if __name__ == "__main__":
+    from embed import load_model, init_worker
     # auto-discover /app/input and /app/output
     in_dir  = Path("/app/input")
     out_dir = Path("/app/output"); out_dir.mkdir(exist_ok=True)
     # iterate over *.json configs adjacent to PDFs
-    for cfg in in_dir.glob("*/challenge1b_input.json"):
-        run(cfg, cfg.parent / "PDFs", out_dir / "challenge1b_output.json")
\ No newline at end of file
+    cfgs = sorted(in_dir.glob("*/challenge1b_input.json"))
+    if len(cfgs) == 1:
+        outs = [out_dir / "challenge1b_output.json"]
+    else:                                   # one file per collection, workers must not share a path
+        outs = [out_dir / cfg.parent.name / "challenge1b_output.json" for cfg in cfgs]
+        for out in outs:
+            out.parent.mkdir(exist_ok=True)
+    # load the encoder once; fork workers inherit it copy-on-write instead of reloading
+    model = load_model()
+    init_worker(model)
+    if len(cfgs) <= 1:
+        for cfg, out in zip(cfgs, outs):
+            run(cfg, cfg.parent / "PDFs", out)
+    else:
+        # split the cores between collections: each gets its share for extraction and ORT
+        outer = min(len(cfgs), os.cpu_count() or 1)
+        inner = max(1, (os.cpu_count() or 1) // outer)
+        with ProcessPoolExecutor(max_workers=outer,
+                                 mp_context=_mp_context(),
+                                 initializer=init_worker, initargs=(model, inner)) as ex:
+            list(ex.map(run, cfgs, [cfg.parent / "PDFs" for cfg in cfgs], outs, [inner] * len(cfgs)))
\ No newline at end of file
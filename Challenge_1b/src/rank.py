@@ -1,24 +1,30 @@
-import faiss, numpy as np
+import faiss, numpy as np, os
 from typing import List, Tuple
-import yake, rake_nltkcd
-from math import log
 
-_kw_extractor = yake.KeywordExtractor(lan="en", n=3, top=20)
+faiss.omp_set_num_threads(os.cpu_count() or 1)  # parallel add/search
 
-def importance(text: str) -> float:
-    kws = _kw_extractor.extract_keywords(text)
-    score = sum((1/score) for kw, score in kws)  # inverse YAKE score
-    return log(1+len(kws)) * score               # length adjust
+def set_threads(n: int) -> None:
+    # collection workers limit FAISS's OpenMP pool to their share of the cores
+    faiss.omp_set_num_threads(max(1, n))
 
-def build_faiss(vecs: np.ndarray, nlist: int = 100) -> faiss.IndexIVFFlat:
-    dim = vecs.shape[1]
-    quant = faiss.IndexFlatIP(dim)             # inner-product == cosine on unit vecs
-    index = faiss.IndexIVFFlat(quant, dim, nlist, faiss.METRIC_INNER_PRODUCT)
-    index.train(vecs)
+def build_faiss(vecs: np.ndarray, flat_max: int = 10_000) -> faiss.Index | np.ndarray:
+    if vecs.shape[0] < flat_max:
+        # small corpora: keep the raw matrix, topk scores it with one GEMV
+        return np.ascontiguousarray(vecs, dtype=np.float32)
+    index = faiss.IndexHNSWFlat(vecs.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = 40
     index.add(vecs)
-    index.nprobe = min(10, nlist//4)           # speed/recall trade-off
     return index
 
 def topk(index, q_vec: np.ndarray, k: int = 15) -> Tuple[np.ndarray, np.ndarray]:
-    # FAISS returns (scores, ids)
-    return index.search(q_vec.reshape(1,-1), k)
\ No newline at end of file
+    # FAISS-style (scores, ids), each shaped (1, k)
+    if isinstance(index, np.ndarray):
+        scores = index @ q_vec                 # inner product == cosine on unit vecs
+        k = min(k, scores.shape[0])
+        if k == 0:
+            return np.empty((1, 0), np.float32), np.empty((1, 0), np.int64)
+        ids = np.argpartition(-scores, k-1)[:k]
+        ids = ids[np.argsort(-scores[ids], kind="stable")]
+        return scores[ids][None, :], ids[None, :]
+    q = np.ascontiguousarray(q_vec.reshape(1,-1), dtype=np.float32)
+    return index.search(q, k)
@@ -1,9 +1,24 @@
 from sumy.nlp.tokenizers import Tokenizer
 from sumy.parsers.plaintext import PlaintextParser
 from sumy.summarizers.lsa import LsaSummarizer
+from sumy.utils import get_stop_words
+import nltk, re
 
+try:                                           # the image ships punkt under NLTK_DATA
+    nltk.data.find("tokenizers/punkt")
+except LookupError:                            # local runs only: fetch it once, fail loudly offline
+    if not nltk.download("punkt", quiet=True):
+        raise LookupError("punkt not found; run `python -m nltk.downloader punkt` or set NLTK_DATA")
+
+_tokenizer  = Tokenizer("english")             # loads punkt once, reused per call
 _summarizer = LsaSummarizer()
+_summarizer.stop_words = get_stop_words("english")   # bundled with sumy, no corpus download
+_sent_end   = re.compile(r"[.!?]+(?:\s|$)")
+_MIN_WORDS  = 50
+
 def refine(text: str, sentences: int = 2) -> str:
-    parser = PlaintextParser.from_string(text, Tokenizer("english"))
+    if len(text.split()) < _MIN_WORDS or len(_sent_end.findall(text)) <= sentences:
+        return text                            # nothing to compress, skip punkt + SVD
+    parser = PlaintextParser.from_string(text, _tokenizer)
     summary = _summarizer(parser.document, sentences)
-    return " ".join(str(s) for s in summary)
\ No newline at end of file
+    return " ".join(str(s) for s in summary)